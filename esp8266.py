@@ -1,7 +1,29 @@
-from busio import UART
 from time import sleep, monotonic
-from os import listdir
-from gc import collect, mem_free
+from random import random
+from os import listdir, mkdir, remove, rename, stat
+from binascii import hexlify
+from json import loads
+
+try:
+    from busio import UART
+except ImportError:
+    # Linux host, e.g. replaying a trace with esp_trace.ReplayUART
+    UART = None
+
+try:
+    from gc import collect, mem_free
+except ImportError:
+    from gc import collect
+
+    def mem_free():
+        # CPython has no mem_free(), report a heap that never needs collecting
+        return 1 << 30
+
+try:
+    from hashlib import new as new_hash
+except ImportError:
+    # Not every CircuitPython build has hashlib, fall back to size only checks
+    new_hash = None
 
 ESP8266_OK_STATUS = "OK\r\n"
 ESP8266_ERROR_STATUS = "ERROR\r\n"
@@ -13,6 +35,58 @@ ESP8266_WIFI_AP_NOT_PRESENT = "WIFI AP NOT FOUND\r\n"
 ESP8266_WIFI_AP_WRONG_PWD = "WIFI AP WRONG PASSWORD\r\n"
 ESP8266_BUSY_STATUS = "busy p...\r\n"
 
+# Running RTT estimate gains and timeout bounds in seconds, as for TCP (RFC 6298)
+ESP8266_RTT_ALPHA = 0.125
+ESP8266_RTT_BETA = 0.25
+ESP8266_MIN_TIMEOUT = 1
+ESP8266_MAX_TIMEOUT = 20
+# A response is complete once no byte arrived for this many seconds
+ESP8266_IDLE_GAP = 0.02
+# Retries of idempotent or busy commands, with jittered exponential backoff in seconds
+ESP8266_RETRIES = 2
+ESP8266_BACKOFF = 0.1
+ESP8266_MAX_BACKOFF = 1
+# How long reStart waits for the ESP8266 to boot
+ESP8266_RESTART_TIMEOUT = 10
+
+# Initial (expected response time, timeout) of each command class, refined by the RTT estimate.
+# The expected time also floors the timeout, the driver stops listening as soon as a response is complete
+_COMMAND_TIMING = {
+    "AT+CWLAP": (1, 5),
+    "AT+CWJAP_CUR": (1, 5),
+    "AT+CIPSTART": (0, 5),
+    "AT+CIPSEND": (0, 5),
+    "HTTP GET": (0, 5),
+    "HTTP POST": (1, 3),
+}
+_DEFAULT_TIMING = (0, 2)
+
+# Commands safe to resend when the ESP8266 doesn't answer at all
+# [A late CIPSTART answers the resend with ALREADY CONNECTED]
+_IDEMPOTENT_COMMANDS = (
+    "AT",
+    "ATE0",
+    "ATE1",
+    "AT+GMR",
+    "AT+CWMODE_CUR",
+    "AT+CWMODE_DEF",
+    "AT+CWLAP",
+    "AT+CWQAP",
+    "AT+CIPCLOSE",
+    "AT+CIPSTART",
+)
+
+# Responses to these are HTTP data (+IPD), complete once CLOSED or Content-Length bytes arrived
+_HTTP_COMMANDS = ("HTTP GET", "HTTP POST")
+
+# Suffix of a partially downloaded asset, renamed into place when complete
+ESP8266_SYNC_TMP_SUFFIX = ".tmp"
+# Directory bit of os.stat()'s mode
+_S_IFDIR = 0x4000
+
+# Collect garbage only once the free heap drops below this many bytes
+ESP8266_GC_WATERMARK = 16384
+
 
 class ESP8266:
     """
@@ -24,10 +98,19 @@ class ESP8266:
         baudRate (int): UART Baud-Rate for communncating between RPI Pico's & ESP8266 [Default 115200]
         txPin (init): RPI Pico's Tx pin [Default Pin 0]
         rxPin (init): RPI Pico's Rx pin [Default Pin 1]
+        lastMemStats (dict): Memory usage of the last HTTP request [rx_bytes, budget, min_free, collections, overflow]
     """
 
     def __init__(
-        self, uartPort=0, baudRate=115200, txPin=(0), rxPin=(1), rx_buffer_size=2048
+        self,
+        uartPort=0,
+        baudRate=115200,
+        txPin=(0),
+        rxPin=(1),
+        rx_buffer_size=2048,
+        mem_budget=None,
+        gc_watermark=ESP8266_GC_WATERMARK,
+        uart=None,
     ):
         """
         The constructor for ESP8266 class
@@ -37,46 +120,239 @@ class ESP8266:
             baudRate (int): UART Baud-Rate for communicating between RPI Pico's & ESP8266 [Default 115200]
             txPin (init): RPI Pico's Tx pin [Default Pin 0]
             rxPin (init): RPI Pico's Rx pin [Default Pin 1]
+            rx_buffer_size (int): UART receive buffer size in bytes [Default 2048]
+            mem_budget (int): Max bytes of a response held in memory, larger responses are refused [Default None, no limit]
+            gc_watermark (int): Only collect garbage when mem_free() drops below this [Default 16384]
+            uart: Use this UART-like object instead of creating a busio.UART [ex: esp_trace.TraceRecorder or ReplayUART]
         """
         self._rx_buffer_size = rx_buffer_size
-        self.__uartObj = UART(
-            txPin,
-            rxPin,
-            baudrate=baudRate,
-            receiver_buffer_size=rx_buffer_size,
-        )
+        self._mem_budget = mem_budget
+        self._gc_watermark = gc_watermark
+        self.lastMemStats = None
+        self._resetMemStats()
+        self._rtt = {}
+        self._lastAttempt = 0
+        if uart is not None:
+            self.__uartObj = uart
+        else:
+            self.__uartObj = UART(
+                txPin,
+                rxPin,
+                baudrate=baudRate,
+                receiver_buffer_size=rx_buffer_size,
+            )
+
+    def _resetMemStats(self):
+        """
+        This is private function for start tracking the memory usage of a new request.
+        """
+        self._mem_stats = {
+            "rx_bytes": 0,
+            "budget": self._mem_budget,
+            "min_free": mem_free(),
+            "collections": 0,
+            "overflow": False,
+        }
+
+    def _collectIfLow(self):
+        """
+        This is private function for collect garbage only when the free heap is below the watermark.
+        """
+        free = mem_free()
+        if free < self._gc_watermark:
+            collect()
+            self._mem_stats["collections"] += 1
+            free = mem_free()
+        if free < self._mem_stats["min_free"]:
+            self._mem_stats["min_free"] = free
+
+    def _finishMemStats(self):
+        """
+        This is private function for publish the memory usage of the finished request.
+        """
+        # Later commands keep updating _mem_stats, publish a snapshot of this request
+        self.lastMemStats = dict(self._mem_stats)
+        if self._mem_budget is not None:
+            print(
+                "HTTP response used",
+                self._mem_stats["rx_bytes"],
+                "of",
+                self._mem_budget,
+                "budget bytes, min free heap:",
+                self._mem_stats["min_free"],
+            )
 
-    def _sendToESP8266(self, atCMD, delay=0, timeout=2):
+    def _timing(self, cmd_class):
+        """
+        This is private function for get the [srtt, rttvar, timeout, min timeout, max timeout] estimate
+        of a command class.
+        """
+        timing = self._rtt.get(cmd_class)
+        if timing is None:
+            expect, timeout = _COMMAND_TIMING.get(cmd_class, _DEFAULT_TIMING)
+            # Start where srtt + 4 * rttvar gives the previously hardcoded timeout,
+            # never go below the expected response time and never back off beyond twice the start
+            timing = [
+                expect,
+                (timeout - expect) / 4,
+                timeout,
+                max(ESP8266_MIN_TIMEOUT, expect),
+                min(timeout * 2, ESP8266_MAX_TIMEOUT),
+            ]
+            self._rtt[cmd_class] = timing
+        return timing
+
+    def _updateRTT(self, cmd_class, sample):
+        """
+        This is private function for fold a response time into the command class's RTT estimate.
+        A sample of None (no complete response) backs the timeout off instead.
+        """
+        timing = self._timing(cmd_class)
+        if sample is None:
+            timing[2] = min(timing[2] * 2, timing[4])
+            return
+        timing[1] += ESP8266_RTT_BETA * (abs(timing[0] - sample) - timing[1])
+        timing[0] += ESP8266_RTT_ALPHA * (sample - timing[0])
+        timing[2] = min(max(timing[0] + 4 * timing[1], timing[3]), ESP8266_MAX_TIMEOUT)
+
+    def _sendToESP8266(
+        self,
+        atCMD,
+        delay=0,
+        timeout=None,
+        max_bytes=None,
+        cmd_class=None,
+        retries=ESP8266_RETRIES,
+        rtt=True,
+    ):
         """
         This is private function for complete ESP8266 AT command Send/Receive operation.
+        Idempotent commands that get no answer at all, and AT commands answered with "busy p...",
+        are retried with jittered backoff. A partial answer isn't retried, as the command is still running.
+        HTTP payloads are never retried, they'd be resent without their AT+CIPSEND.
+        The attempt that answered is left in self._lastAttempt [0 for the first].
+
+        Parameter:
+            timeout (float): Override the command class's adaptive timeout [Default None]
+            max_bytes (int): Refuse (drain and drop) a response larger than this [Default None, no limit]
+            cmd_class (str): Command class for the RTT estimate [Default derived from the AT command]
+            retries (int): Max retries [Default ESP8266_RETRIES]
+            rtt (bool): Update the command class's RTT estimate [Default True]
         """
         if isinstance(atCMD, str):
             atCMD = atCMD.encode("utf-8")
+        if cmd_class is None:
+            cmd_class = _commandClass(atCMD)
+        if timeout is None:
+            # Retries reuse the timeout, it only backs off once the command has failed
+            timeout = self._timing(cmd_class)[2]
+
+        for attempt in range(retries + 1):
+            self._lastAttempt = attempt
+            _rxData = self._transactESP8266(
+                atCMD, delay, timeout, max_bytes, cmd_class, rtt
+            )
+            if _rxData is None:
+                if max_bytes is not None and self._mem_stats["overflow"]:
+                    # Refused by the memory budget, the ESP8266 did answer
+                    return None
+                if cmd_class not in _IDEMPOTENT_COMMANDS:
+                    break
+            elif cmd_class in _HTTP_COMMANDS:
+                # Status strings may be payload bytes, parseHTTP checks the response
+                return _rxData
+            elif ESP8266_BUSY_STATUS in _rxData:
+                # Still processing a previous command, wait and retry
+                pass
+            elif ESP8266_OK_STATUS in _rxData:
+                return _rxData
+            elif ESP8266_ERROR_STATUS in _rxData:
+                return _rxData
+            elif ESP8266_FAIL_STATUS in _rxData:
+                return _rxData
+            else:
+                break
+
+            if attempt < retries:
+                sleep(_backoff(attempt))
+
+        if rtt:
+            self._updateRTT(cmd_class, None)
+        return None
+
+    def _transactESP8266(self, atCMD, delay, timeout, max_bytes, cmd_class, rtt):
+        """
+        This is private function for write one command and read its response.
+        Listens until the response is complete and the line went idle, or until the timeout.
+        Only responses that reached their final status are used as RTT samples.
+        """
         # print("-->", atCMD)
         self.__uartObj.write(atCMD)
-        del atCMD
 
         sleep(delay)
         stamp = monotonic()
-        while (monotonic() - stamp) < timeout:
-            if self.__uartObj.in_waiting > 0:
-                break
+        deadline = stamp + timeout
 
         _rxData = bytes()
-        while self.__uartObj.in_waiting > 0:
-            _rxData += self.__uartObj.read(self._rx_buffer_size)
+        _rxLen = 0
+        overflow = False
+        complete = False
+        last = None
+        # Follows the +IPD framing, even of the bytes dropped once over the memory budget
+        ipd = _IPDParser() if cmd_class in _HTTP_COMMANDS else None
+        while True:
+            now = monotonic()
+            if self.__uartObj.in_waiting > 0:
+                chunk = self.__uartObj.read(self._rx_buffer_size)
+                if chunk is None:
+                    continue
+                last = monotonic()
+                _rxLen += len(chunk)
+                if ipd is not None:
+                    ipd.feed(chunk)
+                if overflow:
+                    # Keep draining the UART so the next command starts clean
+                    continue
+                if max_bytes is not None and _rxLen > max_bytes:
+                    overflow = True
+                    # Slice rather than bytes(), keeping the type of the UART's data
+                    _rxData = _rxData[:0]
+                    del chunk
+                    continue
+                self._collectIfLow()
+                _rxData += chunk
+                del chunk
+            elif last is None:
+                if now >= deadline:
+                    break
+            elif now - last >= ESP8266_IDLE_GAP:
+                if ipd is not None:
+                    # Status strings may also be payload bytes, only look outside the +IPD payloads.
+                    # Once over budget, this drains until the end of the response, or the deadline
+                    complete = ipd.complete or ipd.busy or ipd.error
+                else:
+                    complete = overflow or _responseComplete(_rxData)
+                if complete or now >= deadline:
+                    break
         # print("<--", _rxData)
 
-        if ESP8266_OK_STATUS in _rxData:
-            return _rxData
-        elif ESP8266_ERROR_STATUS in _rxData:
-            return _rxData
-        elif ESP8266_FAIL_STATUS in _rxData:
-            return _rxData
-        elif ESP8266_BUSY_STATUS in _rxData:
-            return "ESP BUSY\r\n"
-        else:
+        if rtt and complete and not overflow:
+            if ipd is not None:
+                final = ipd.complete and not ipd.busy and not ipd.error
+            else:
+                final = _responseFinal(_rxData)
+            if final:
+                self._updateRTT(cmd_class, last - stamp)
+
+        if _rxLen > self._mem_stats["rx_bytes"]:
+            self._mem_stats["rx_bytes"] = _rxLen
+        if overflow:
+            self._mem_stats["overflow"] = True
+            print("Response of", _rxLen, "bytes exceeds memory budget of", max_bytes)
+            return None
+        if last is None:
             return None
+        return _rxData
 
     def startUP(self):
         """
@@ -106,9 +382,24 @@ class ESP8266:
         retData = self._sendToESP8266("AT+RST\r\n")
         if retData != None:
             if ESP8266_OK_STATUS in retData:
-                sleep(5)
-                # self.startUP()
-                return self.startUP()
+                # Poll until the ESP8266 has booted instead of a fixed wait. Each poll is bounded
+                # by the time left, and boot time isn't fed into the "AT" RTT estimate
+                deadline = monotonic() + ESP8266_RESTART_TIMEOUT
+                attempt = 0
+                while True:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return False
+                    retData = self._sendToESP8266(
+                        "AT\r\n",
+                        timeout=min(remaining, self._timing("AT")[2]),
+                        retries=0,
+                        rtt=False,
+                    )
+                    if retData != None and ESP8266_OK_STATUS in retData:
+                        return True
+                    sleep(min(_backoff(attempt), max(deadline - monotonic(), 0)))
+                    attempt += 1
             else:
                 return False
         else:
@@ -278,7 +569,7 @@ class ESP8266:
         Retuns:
             List of Available APs or None
         """
-        retData = str(self._sendToESP8266("AT+CWLAP\r\n", delay=1, timeout=5))
+        retData = str(self._sendToESP8266("AT+CWLAP\r\n"))
         if retData != None:
             retData = list(
                 retData.replace("+CWLAP:", "")
@@ -315,7 +606,7 @@ class ESP8266:
         """
         txData = "AT+CWJAP_CUR=" + '"' + ssid + '"' + "," + '"' + pwd + '"' + "\r\n"
         # print(txData)
-        retData = self._sendToESP8266(txData, delay=1, timeout=5)
+        retData = self._sendToESP8266(txData)
         # print(".....")
         # print(retData)
         if retData != None:
@@ -357,7 +648,7 @@ class ESP8266:
         else:
             return False
 
-    def _createTCPConnection(self, link, port=80, delay=0, timeout=2):
+    def _createTCPConnection(self, link, port=80, delay=0, timeout=None):
         """
         This function is used to create connect between ESP8266 and Host.
         Just like create a socket before complete the HTTP Get/Post operation.
@@ -372,6 +663,9 @@ class ESP8266:
         if retData != None:
             if ESP8266_OK_STATUS in retData:
                 return True
+            elif self._lastAttempt > 0 and b"ALREADY CONNECTED" in retData:
+                # A retry after the first attempt connected late, not an earlier connection
+                return True
             else:
                 return False
         else:
@@ -412,10 +706,41 @@ class ESP8266:
         Return:
             HTTP error code & HTTP response[If error not equal to 200 then the response is None]
             On failed return 0 and None
+            Responses larger than the memory budget are refused and return 0 and None
+
+        """
+        self._resetMemStats()
+        code, resp = self._doHttpGet(
+            host,
+            path,
+            user_agent,
+            port,
+            chunk_dir,
+            file,
+            open_conn,
+            close_conn,
+            writeable_mc,
+        )
+        self._finishMemStats()
+        return code, resp
 
+    def _doHttpGet(
+        self,
+        host,
+        path,
+        user_agent,
+        port,
+        chunk_dir,
+        file,
+        open_conn,
+        close_conn,
+        writeable_mc,
+    ):
+        """
+        This is private function for complete the HTTP Get operation of doHttpGet.
         """
         if open_conn:
-            connected = self._createTCPConnection(host, port, timeout=5)
+            connected = self._createTCPConnection(host, port)
         else:
             connected = True
 
@@ -426,17 +751,18 @@ class ESP8266:
                 + f"User-Agent: {user_agent}\r\n\r\n"
             )
             txData = "AT+CIPSEND=" + str(len(getHeader)) + "\r\n"
-            retData = self._sendToESP8266(txData, timeout=5)
+            retData = self._sendToESP8266(txData)
             del txData
-            collect()
+            self._collectIfLow()
 
             if retData != None:
                 if ">" in retData:
-                    retData = self._sendToESP8266(getHeader, timeout=5)
-                    collect()
+                    retData = self._sendToESP8266(
+                        getHeader, max_bytes=self._mem_budget, cmd_class="HTTP GET"
+                    )
                     code, resp = parseHTTP(retData)
                     del retData
-                    collect()
+                    self._collectIfLow()
 
                     # Ensure formatting to find with os.listdir()
                     if file is not None:
@@ -489,6 +815,105 @@ class ESP8266:
             self._sendToESP8266("AT+CIPCLOSE\r\n")
             return 0, None
 
+    def syncAssets(
+        self,
+        host: str,
+        manifest_path: str,
+        chunk_dir: str,
+        asset_path: str = None,
+        user_agent: str = "RPi-Pico",
+        port: int = 80,
+    ):
+        """
+        This function is used to sync assets onto the microcontroller, downloading only changed or missing files
+
+        The manifest is a JSON document listing the remote files, paths are relative to chunk_dir:
+            {"files": [{"path": "logo.png", "size": 1234, "sha256": "9f86d0..."}, ...]}
+        Each file is downloaded to a temporary name, verified against the manifest, then renamed into place.
+        FAT can't rename onto an existing file, so the old file is removed first. If power is lost in between,
+        the next sync renames the verified temporary file into place instead of downloading it again.
+        Each file is held in memory while downloading, so with a mem_budget set, files larger than the
+        budget can't be synced and are reported as "too_large".
+
+        Parameter:
+            host (str): Host URL [ex: "www.example.com"]
+            manifest_path (str): Manifest's URL path [ex: "/dash/manifest.json"]
+            chunk_dir (str): Sync the files into this directory (must exist, subdirectories are created)
+            asset_path (str): URL path the manifest's files live under [Default the manifest's directory]
+            user-agent (str): User Agent Name [Default "RPi-Pico"]
+            post (int): HTTP post number [Default port number 80]
+
+        Return:
+            Dict of "downloaded", "skipped", "failed" and "too_large" file name lists [Invalid manifest entries are failed]
+            None if the manifest could not be fetched or parsed
+        """
+        code, resp = self.doHttpGet(host, manifest_path, user_agent, port=port)
+        if code != 200 or resp is None:
+            return None
+        try:
+            files = loads(resp)["files"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        if not isinstance(files, list):
+            return None
+        del resp
+        self._collectIfLow()
+
+        if asset_path is None:
+            asset_path = manifest_path.rpartition("/")[0]
+        asset_path = asset_path.rstrip("/")
+        chunk_dir = chunk_dir.strip("/")
+
+        result = {"downloaded": [], "skipped": [], "failed": [], "too_large": []}
+        for entry in files:
+            name = _manifestPath(entry)
+            if name is None:
+                result["failed"].append(str(entry))
+                continue
+            path = f"{chunk_dir}/{name}"
+            tmp = path + ESP8266_SYNC_TMP_SUFFIX
+            if _isDir(path):
+                result["failed"].append(name)
+                continue
+
+            if _fileMatches(path, entry):
+                result["skipped"].append(name)
+                continue
+
+            # A verified leftover from an interrupted sync doesn't need downloading again
+            if not _fileMatches(tmp, entry):
+                code, resp = self.doHttpGet(
+                    host, f"{asset_path}/{name}", user_agent, port=port
+                )
+                if code != 200 or resp is None:
+                    if self.lastMemStats["overflow"]:
+                        result["too_large"].append(name)
+                    else:
+                        result["failed"].append(name)
+                    continue
+                try:
+                    _makeDirs(path)
+                    with open(tmp, "wb") as f:
+                        f.write(resp)
+                except OSError:
+                    result["failed"].append(name)
+                    continue
+                finally:
+                    del resp
+                    self._collectIfLow()
+
+                if not _fileMatches(tmp, entry):
+                    remove(tmp)
+                    result["failed"].append(name)
+                    continue
+
+            if _exists(path):
+                remove(path)
+            rename(tmp, path)
+            result["downloaded"].append(name)
+
+        return result
+
     def doHttpPost(self, host, path, user_agent, content_type, content, port=80):
         """
         This function is used to complete a HTTP Post operation
@@ -504,9 +929,21 @@ class ESP8266:
         Return:
             HTTP error code & HTTP response[If error not equal to 200 then the response is None]
             On failed return 0 and None
+            Responses larger than the memory budget are refused and return 0 and None
+
+        """
+        self._resetMemStats()
+        code, resp = self._doHttpPost(
+            host, path, user_agent, content_type, content, port
+        )
+        self._finishMemStats()
+        return code, resp
 
+    def _doHttpPost(self, host, path, user_agent, content_type, content, port):
         """
-        if self._createTCPConnection(host, port, timeout=5):
+        This is private function for complete the HTTP Post operation of doHttpPost.
+        """
+        if self._createTCPConnection(host, port):
             postHeader = (
                 "POST "
                 + path
@@ -532,7 +969,9 @@ class ESP8266:
             retData = self._sendToESP8266(txData)
             if retData != None:
                 if ">" in retData:
-                    retData = self._sendToESP8266(postHeader, delay=1, timeout=3)
+                    retData = self._sendToESP8266(
+                        postHeader, max_bytes=self._mem_budget, cmd_class="HTTP POST"
+                    )
                     self._sendToESP8266("AT+CIPCLOSE\r\n")
 
                     code, resp = parseHTTP(retData)
@@ -557,6 +996,255 @@ class ESP8266:
         pass
 
 
+def _commandClass(atCMD):
+    """
+    This is private function for get the class of an AT command, its name without arguments [ex: "AT+CIPSTART"]
+    """
+    return str(atCMD.split(b"\r\n")[0].split(b"=")[0].split(b"?")[0], "utf-8")
+
+
+def _responseComplete(rxData):
+    """
+    This is private function for check whether the ESP8266 has finished answering an AT command.
+    HTTP responses are followed by _IPDParser instead.
+    """
+    if ESP8266_BUSY_STATUS in rxData or ESP8266_ERROR_STATUS in rxData:
+        return True
+    return ESP8266_OK_STATUS in rxData or ESP8266_FAIL_STATUS in rxData
+
+
+def _responseFinal(rxData):
+    """
+    This is private function for check whether a complete AT response is the command's real final status.
+    Busy and error replies come back in milliseconds, so they'd pull the RTT estimate down.
+    """
+    if ESP8266_BUSY_STATUS in rxData or ESP8266_ERROR_STATUS in rxData:
+        return False
+    return ESP8266_OK_STATUS in rxData
+
+
+def _contentLength(header):
+    """
+    This is private function for get the Content-Length of an HTTP header, None if it has none.
+    """
+    for line in header.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            try:
+                return int(str(value.strip(), "utf-8"))
+            except ValueError:
+                return None
+    return None
+
+
+def _httpComplete(rxData):
+    """
+    This is private function for check whether an HTTP response has fully arrived.
+    It is, once CLOSED was seen or the +IPD payloads after the header reach the Content-Length.
+    """
+    ipd = _IPDParser()
+    ipd.feed(rxData)
+    return ipd.complete
+
+
+class _IPDParser:
+    """
+    This is a private class for follow the +IPD framing of an HTTP response as it arrives, chunk by chunk.
+    Only the HTTP header and the AT status text outside the payloads are kept, the body is just counted.
+
+    Attributes:
+        content_length (int): The HTTP Content-Length, None until the header arrived or if it has none
+        body (int): Body bytes received so far
+        closed (bool): CLOSED was seen outside the payloads
+        busy (bool): busy p... was seen outside the payloads
+        error (bool): ERROR was seen outside the payloads
+    """
+
+    def __init__(self):
+        self.content_length = None
+        self.body = 0
+        self.closed = False
+        self.busy = False
+        self.error = False
+        self._text = b""
+        self._head = b""
+        self._header_done = False
+        self._remaining = 0
+
+    @property
+    def complete(self):
+        """
+        True once CLOSED was seen or the body reached the Content-Length
+        """
+        if self.closed:
+            return True
+        return self.content_length is not None and self.body >= self.content_length
+
+    def feed(self, data):
+        """
+        This function is used to parse the next chunk of the response
+        """
+        pos = 0
+        while pos < len(data):
+            if self._remaining:
+                take = min(self._remaining, len(data) - pos)
+                self._payload(data, pos, take)
+                self._remaining -= take
+                pos += take
+                continue
+
+            text = self._text + data[pos:]
+            pos = len(data)
+            start = text.find(b"+IPD,")
+            if start < 0:
+                self._status(text)
+                # Keep enough to match a status or "+IPD," split across chunks
+                self._text = text[-16:]
+                continue
+            self._status(text[:start])
+            colon = text.find(b":", start)
+            if colon < 0:
+                # Wait for the rest of the +IPD header
+                self._text = text[start:]
+                continue
+            try:
+                self._remaining = int(str(text[start + 5 : colon], "utf-8"))
+            except ValueError:
+                # Not a +IPD header after all, go on after it
+                self._text = b""
+                data = text[start + 5 :]
+                pos = 0
+                continue
+            self._text = b""
+            data = text[colon + 1 :]
+            pos = 0
+
+    def _status(self, text):
+        """
+        This is private function for note the AT status strings outside the payloads.
+        """
+        if b"CLOSED\r\n" in text:
+            self.closed = True
+        if b"busy p...\r\n" in text:
+            self.busy = True
+        if b"ERROR\r\n" in text:
+            self.error = True
+
+    def _payload(self, data, pos, take):
+        """
+        This is private function for account for payload bytes, keeping only the HTTP header.
+        """
+        if self._header_done:
+            self.body += take
+            return
+        self._head += data[pos : pos + take]
+        header, sep, rest = self._head.partition(b"\r\n\r\n")
+        if sep:
+            self._header_done = True
+            self.content_length = _contentLength(header)
+            self.body = len(rest)
+            self._head = b""
+
+
+def _backoff(attempt):
+    """
+    This is private function for get the jittered exponential backoff delay of a retry.
+    """
+    return min(ESP8266_BACKOFF * (1 << attempt), ESP8266_MAX_BACKOFF) * (0.5 + random())
+
+
+def _manifestPath(entry):
+    """
+    This is private function for get the validated relative path of a manifest entry
+
+    Return:
+        The path without leading/trailing "/", None if the entry is invalid
+    """
+    if not isinstance(entry, dict):
+        return None
+    if "size" in entry and (
+        isinstance(entry["size"], bool) or not isinstance(entry["size"], int)
+    ):
+        return None
+    if "sha256" in entry and not isinstance(entry["sha256"], str):
+        return None
+    name = entry.get("path")
+    if not isinstance(name, str):
+        return None
+    name = name.strip("/")
+    for part in name.split("/"):
+        if part in ("", ".", ".."):
+            return None
+    return name
+
+
+def _exists(path):
+    """
+    This is private function for check whether a file or directory exists.
+    """
+    try:
+        stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def _isDir(path):
+    """
+    This is private function for check whether a path is an existing directory.
+    """
+    try:
+        return stat(path)[0] & _S_IFDIR != 0
+    except OSError:
+        return False
+
+
+def _makeDirs(path):
+    """
+    This is private function for create the missing parent directories of a file.
+    """
+    parts = path.split("/")[:-1]
+    for i in range(1, len(parts) + 1):
+        directory = "/".join(parts[:i])
+        if not _exists(directory):
+            mkdir(directory)
+
+
+def _fileMatches(path, entry, block_size=512):
+    """
+    This is private function for check a local file against its manifest entry (size, then sha256 if available)
+
+    Return:
+        True if the file matches the manifest entry, else False
+    """
+    try:
+        st = stat(path)
+    except OSError:
+        return False
+    if st[0] & _S_IFDIR:
+        return False
+    size = st[6]
+    if "size" in entry and size != entry["size"]:
+        return False
+
+    if new_hash is None or "sha256" not in entry:
+        return True
+
+    try:
+        digest = new_hash("sha256")
+    except ValueError:
+        # hashlib without sha256 support, fall back to the size check
+        return True
+    buf = bytearray(block_size)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(buf[:n])
+    return str(hexlify(digest.digest()), "utf-8") == entry["sha256"].lower()
+
+
 def parseHTTP(httpRes):
     """
     This function is used to parse the HTTP response and return back the HTTP status code
@@ -582,13 +1270,14 @@ def parseHTTP(httpRes):
     if httpErrCode != 200:
         return httpErrCode, None
 
-    if b"\r\n+IPD" not in httpRes:
-        # Don't need to filter
-        return httpErrCode, httpRes
-
+    length = _contentLength(header)
     # Free up some memory
     del header, code
 
+    if b"\r\n+IPD" not in httpRes:
+        # Don't need to filter
+        return _checkLength(httpErrCode, httpRes, length)
+
     # Remove all: b'\r\n+IPD,####:' from http get
     res = b""
     while b"\r\n+IPD" in httpRes:
@@ -603,4 +1292,19 @@ def parseHTTP(httpRes):
 
     res += httpRes
 
-    return httpErrCode, res
+    return _checkLength(httpErrCode, res, length)
+
+
+def _checkLength(httpErrCode, body, length):
+    """
+    This is private function for check a parsed HTTP body against its Content-Length
+
+    Return:
+        HTTP status code & the body cut to Content-Length (dropping e.g. CLOSED)
+        0 and None if the body is shorter than Content-Length
+    """
+    if length is None:
+        return httpErrCode, body
+    if len(body) < length:
+        return 0, None
+    return httpErrCode, body[:length]
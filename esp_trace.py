@@ -0,0 +1,312 @@
+"""
+UART trace recording and replay for the ESP8266 class
+
+Record on the device by wrapping the UART:
+
+    uart = TraceRecorder(UART(board.GP0, board.GP1, baudrate=115200, receiver_buffer_size=2048), "/esp.trace")
+    esp01 = ESP8266(uart=uart)
+    ...
+    uart.close()  # Or uart.flush(), records not yet written are lost otherwise
+
+Replay on a Linux host, as fast as possible or in real-time:
+
+    uart = ReplayUART("esp.trace", realtime=False)
+    esp01 = ESP8266(uart=uart)
+    ...
+    uart.close()  # Raises ValueError if the trace wasn't fully replayed
+
+Dump a trace with: python esp_trace.py esp.trace
+"""
+from struct import pack, unpack, calcsize
+
+try:
+    from time import monotonic_ns
+except ImportError:
+    from time import monotonic
+
+    def monotonic_ns():
+        return int(monotonic() * 1000000000)
+
+
+TRACE_MAGIC = b"ESPT\x01"
+TRACE_TX = 0
+TRACE_RX = 1
+
+# Record header: direction, milliseconds since the trace started, payload length
+_RECORD_FORMAT = "<BIH"
+_RECORD_SIZE = calcsize(_RECORD_FORMAT)
+_MAX_PAYLOAD = 0xFFFF
+
+
+class TraceRecorder:
+    """
+    This is a class for recording the TX/RX byte streams of a UART to a binary trace file.
+    It wraps the UART and can be passed to ESP8266(uart=...) in place of it.
+    Records are kept in RAM and written to flash before each command is sent, once the previous
+    response has been read, so slow flash writes can't overrun the UART receive buffer.
+    The RAM buffer is capped at buffer_size, a response larger than that is written out as it is read.
+    Call flush() or close() when done, or e.g. in an except handler before a crash: the records
+    since the last command are only in RAM until then.
+
+    Attributes:
+        uart: The wrapped UART object
+        path (str): Trace file path [The filesystem must be writeable]
+    """
+
+    def __init__(self, uart, path, buffer_size=2048):
+        """
+        The constructor for TraceRecorder class
+
+        Parameters:
+            uart: The UART object to wrap
+            path (str): Trace file path, overwritten if it exists
+            buffer_size (int): Write the records out once this many bytes are buffered [Default 2048]
+        """
+        self.uart = uart
+        self.path = path
+        self._buffer_size = buffer_size
+        self._start = monotonic_ns()
+        self._file = open(path, "wb")
+        self._file.write(TRACE_MAGIC)
+        self._records = bytearray()
+
+    def _record(self, direction, data):
+        """
+        This is private function for append one timestamped record to the RAM buffer.
+        """
+        if self._file is None or not data:
+            return
+        stamp = ((monotonic_ns() - self._start) // 1000000) & 0xFFFFFFFF
+        for i in range(0, len(data), _MAX_PAYLOAD):
+            payload = data[i : i + _MAX_PAYLOAD]
+            self._records += pack(_RECORD_FORMAT, direction, stamp, len(payload))
+            self._records += payload
+
+    def flush(self):
+        """
+        This function is used to write the buffered records to the trace file
+        """
+        if self._file is None or not self._records:
+            return
+        self._file.write(self._records)
+        self._file.flush()
+        self._records = bytearray()
+
+    def write(self, buf):
+        # The previous response has been read, so the UART is idle while writing to flash
+        self.flush()
+        self._record(TRACE_TX, buf)
+        return self.uart.write(buf)
+
+    def read(self, nbytes=None):
+        data = self.uart.read(nbytes)
+        if data is not None:
+            self._record(TRACE_RX, data)
+            if len(self._records) >= self._buffer_size:
+                self.flush()
+        return data
+
+    @property
+    def in_waiting(self):
+        return self.uart.in_waiting
+
+    def close(self):
+        """
+        This function is used to stop recording and close the trace file
+        """
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __getattr__(self, name):
+        return getattr(self.uart, name)
+
+
+def readTrace(path):
+    """
+    This function is used to read a binary trace file
+
+    Return:
+        List of (direction, milliseconds, bytes) records
+    """
+    records = []
+    with open(path, "rb") as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError("Not an ESP8266 trace file: " + path)
+        while True:
+            header = f.read(_RECORD_SIZE)
+            if len(header) < _RECORD_SIZE:
+                # A truncated final record is expected if the device lost power
+                break
+            direction, stamp, length = unpack(_RECORD_FORMAT, header)
+            payload = f.read(length)
+            if len(payload) < length:
+                break
+            records.append((direction, stamp, payload))
+    return records
+
+
+class _HostBytes(bytes):
+    """
+    MicroPython lets the driver search bytes for a str (ESP8266_OK_STATUS in retData), CPython doesn't.
+    The replayed RX data emulates that, and stays _HostBytes when concatenated in _sendToESP8266.
+    """
+
+    def __contains__(self, item):
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+        return bytes.__contains__(self, item)
+
+    def __add__(self, other):
+        return _HostBytes(bytes(self) + bytes(other))
+
+    def __radd__(self, other):
+        return _HostBytes(bytes(other) + bytes(self))
+
+
+class ReplayUART:
+    """
+    This is a class for feeding a recorded trace back into the ESP8266 class in place of a UART.
+    Each write must match the next recorded TX, after which the recorded RX bytes become readable.
+
+    The recorder only logs the bytes the driver read, so every RX between two TXs must be read
+    before the next write. A write that comes earlier (the driver timed out or stopped reading
+    sooner than on the device) is a divergence, as is a trace left unfinished at close().
+    As fast as possible playback delivers each response at once, so decisions that depend on when
+    bytes arrive (timeouts, retries, idle gaps) can diverge; replay in real-time to reproduce them.
+
+    Attributes:
+        realtime (bool): Deliver RX bytes with their recorded delay after each TX, else immediately
+        strict (bool): Raise ValueError on a divergence from the trace
+        mismatches (list): (record index, expected, actual) for every divergence when not strict
+    """
+
+    def __init__(self, path, realtime=False, strict=True):
+        """
+        The constructor for ReplayUART class
+
+        Parameters:
+            path (str): Trace file path
+            realtime (bool): Replay with the recorded timing [Default False, as fast as possible]
+            strict (bool): Raise ValueError on a write that differs from the trace [Default True]
+        """
+        self.realtime = realtime
+        self.strict = strict
+        self.mismatches = []
+        self._records = readTrace(path)
+        self._index = 0
+        self._pending = []
+        self._buf = bytearray()
+
+    @property
+    def done(self):
+        """
+        True once every record of the trace has been replayed
+        """
+        return (
+            self._index >= len(self._records) and not self._pending and not self._buf
+        )
+
+    def _diverged(self, message, expected, actual):
+        """
+        This is private function for report a divergence from the trace.
+        """
+        if self.strict:
+            raise ValueError(message)
+        self.mismatches.append((self._index, expected, actual))
+
+    def _schedule(self, due, payload):
+        self._pending.append((due, payload))
+
+    def _deliver(self):
+        """
+        This is private function for move every RX payload that is due into the read buffer.
+        """
+        now = monotonic_ns()
+        while self._pending and self._pending[0][0] <= now:
+            self._buf += self._pending.pop(0)[1]
+
+    def write(self, buf):
+        records = self._records
+        if self._buf or self._pending:
+            unread = bytes(self._buf) + b"".join(p for _, p in self._pending)
+            self._diverged(
+                "Write at record "
+                + str(self._index)
+                + " before the previous response was read, unread: "
+                + repr(unread),
+                unread,
+                b"",
+            )
+        # RX before the first TX, e.g. the ESP8266 boot banner
+        while self._index < len(records) and records[self._index][0] == TRACE_RX:
+            self._schedule(0, records[self._index][2])
+            self._index += 1
+
+        if self._index >= len(records):
+            raise ValueError("Trace exhausted, unexpected write: " + repr(bytes(buf)))
+
+        _, tx_stamp, expected = records[self._index]
+        if bytes(buf) != expected:
+            self._diverged(
+                "Write at record "
+                + str(self._index)
+                + " differs from trace: "
+                + repr(bytes(buf))
+                + " != "
+                + repr(expected),
+                expected,
+                bytes(buf),
+            )
+        self._index += 1
+
+        # Anchor the recorded RX timing on this write, so host-side slowness doesn't accumulate
+        anchor = monotonic_ns()
+        while self._index < len(records) and records[self._index][0] == TRACE_RX:
+            _, rx_stamp, payload = records[self._index]
+            if self.realtime:
+                self._schedule(anchor + (rx_stamp - tx_stamp) * 1000000, payload)
+            else:
+                self._schedule(0, payload)
+            self._index += 1
+        return len(buf)
+
+    def read(self, nbytes=None):
+        self._deliver()
+        if not self._buf:
+            return None
+        if nbytes is None:
+            nbytes = len(self._buf)
+        data = _HostBytes(self._buf[:nbytes])
+        del self._buf[:nbytes]
+        return data
+
+    @property
+    def in_waiting(self):
+        self._deliver()
+        return len(self._buf)
+
+    def reset_input_buffer(self):
+        self._buf = bytearray()
+
+    def close(self):
+        """
+        This function is used to check that the whole trace was replayed
+        """
+        if not self.done:
+            self._diverged(
+                "Replay stopped at record "
+                + str(self._index)
+                + " of "
+                + str(len(self._records)),
+                None,
+                None,
+            )
+
+
+if __name__ == "__main__":
+    import sys
+
+    for direction, stamp, payload in readTrace(sys.argv[1]):
+        print(f"{stamp:>10} {'-->' if direction == TRACE_TX else '<--'} {payload!r}")
@@ -0,0 +1,106 @@
+import os
+import sys
+from time import sleep
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from esp_trace import ReplayUART, TraceRecorder, _HostBytes
+
+
+class ScriptedUART:
+    """
+    UART stand-in, reads return the bytes fed to it [as _HostBytes, like ReplayUART]
+    """
+
+    def __init__(self):
+        self._buf = b""
+
+    def feed(self, data):
+        self._buf += data
+
+    def write(self, buf):
+        return len(buf)
+
+    @property
+    def in_waiting(self):
+        return len(self._buf)
+
+    def read(self, nbytes=None):
+        if not self._buf:
+            return None
+        if nbytes is None:
+            nbytes = len(self._buf)
+        data, self._buf = self._buf[:nbytes], self._buf[nbytes:]
+        return _HostBytes(data)
+
+
+def makeTrace(path, exchanges):
+    """
+    Write a trace of (tx, [rx chunks]) exchanges with TraceRecorder.
+    A chunk given as (seconds, bytes) is recorded that much later than the previous one.
+    """
+    uart = ScriptedUART()
+    recorder = TraceRecorder(uart, path)
+    for tx, chunks in exchanges:
+        recorder.write(tx)
+        for chunk in chunks:
+            if isinstance(chunk, tuple):
+                sleep(chunk[0])
+                chunk = chunk[1]
+            uart.feed(chunk)
+            recorder.read(len(chunk))
+    recorder.close()
+
+
+def ipd(payload):
+    return b"\r\n+IPD," + str(len(payload)).encode() + b":" + payload
+
+
+def _ipdChunk(packet):
+    if isinstance(packet, tuple):
+        return (packet[0], ipd(packet[1]))
+    return ipd(packet)
+
+
+def httpGetExchanges(host, path, packets, user_agent="RPi-Pico"):
+    """
+    The exchanges of a doHttpGet whose response arrives as the given +IPD payloads,
+    a payload given as (seconds, bytes) arrives that much later
+    """
+    header = (
+        f"GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: {user_agent}\r\n\r\n"
+    ).encode()
+    return [
+        (f'AT+CIPSTART="TCP","{host}",80\r\n'.encode(), [b"CONNECT\r\n\r\nOK\r\n"]),
+        (b"AT+CIPSEND=" + str(len(header)).encode() + b"\r\n", [b"\r\nOK\r\n> "]),
+        (header, [b"\r\nSEND OK\r\n"] + [_ipdChunk(packet) for packet in packets]),
+        (b"AT+CIPCLOSE\r\n", [b"CLOSED\r\n\r\nOK\r\n"]),
+    ]
+
+
+def httpResponse(body, content_length=True):
+    header = b"HTTP/1.1 200 OK\r\n"
+    if content_length:
+        header += b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+    return header + b"\r\n" + body
+
+
+@pytest.fixture
+def replay(tmp_path):
+    """
+    Make a ReplayUART of the given exchanges, checked to be fully replayed at teardown
+    """
+    uarts = []
+
+    def make(exchanges, **kwargs):
+        path = str(tmp_path / f"esp{len(uarts)}.trace")
+        makeTrace(path, exchanges)
+        uart = ReplayUART(path, **kwargs)
+        uarts.append(uart)
+        return uart
+
+    yield make
+    for uart in uarts:
+        uart.close()
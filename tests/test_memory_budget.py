@@ -0,0 +1,44 @@
+from conftest import httpGetExchanges, httpResponse
+from esp8266 import ESP8266
+
+
+def test_response_within_budget(replay):
+    body = b"x" * 100
+    uart = replay(httpGetExchanges("h", "/p", [httpResponse(body)]))
+    esp = ESP8266(uart=uart, mem_budget=1000)
+
+    assert esp.doHttpGet("h", "/p") == (200, body)
+    assert esp.lastMemStats["overflow"] is False
+    assert esp.lastMemStats["budget"] == 1000
+    assert 100 < esp.lastMemStats["rx_bytes"] <= 1000
+
+
+def test_over_budget_drains_whole_response(replay):
+    response = httpResponse(b"a" * 1000 + b"b" * 1000 + b"c" * 1000)
+    split = len(response) - 2000
+    packets = [
+        response[:split],
+        (0.1, response[split : split + 1000]),
+        (0.1, response[split + 1000 :]),
+    ]
+    # Real-time, so the later packets arrive after an idle gap; unread bytes at
+    # the next write (AT+CIPCLOSE) make the replay raise
+    uart = replay(httpGetExchanges("h", "/p", packets), realtime=True)
+    esp = ESP8266(uart=uart, mem_budget=1000)
+
+    assert esp.doHttpGet("h", "/p") == (0, None)
+    assert esp.lastMemStats["overflow"] is True
+    assert esp.lastMemStats["rx_bytes"] > 3000
+    # A refused response isn't an RTT sample
+    assert esp._timing("HTTP GET")[0] == 0
+
+
+def test_mem_stats_are_a_snapshot(replay):
+    exchanges = httpGetExchanges("h", "/p", [httpResponse(b"hello")])
+    exchanges.append((b"AT+CWQAP\r\n", [b"\r\n" + b"x" * 500 + b"\r\nOK\r\n"]))
+    esp = ESP8266(uart=replay(exchanges))
+
+    esp.doHttpGet("h", "/p")
+    stats = dict(esp.lastMemStats)
+    assert esp.disconnectWiFi()
+    assert esp.lastMemStats == stats
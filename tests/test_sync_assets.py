@@ -0,0 +1,115 @@
+import json
+import os
+from hashlib import sha256
+
+import pytest
+
+from conftest import httpGetExchanges, httpResponse
+from esp8266 import ESP8266
+
+ASSETS = {"logo.png": b"\x89PNG logo", "js/app.js": b"console.log(1)"}
+
+
+def manifest(files):
+    return json.dumps(
+        {
+            "files": [
+                {"path": name, "size": len(data), "sha256": sha256(data).hexdigest()}
+                for name, data in files.items()
+            ]
+        }
+    ).encode()
+
+
+def syncExchanges(manifest_body, downloads):
+    exchanges = httpGetExchanges(
+        "h", "/dash/manifest.json", [httpResponse(manifest_body)]
+    )
+    for name in downloads:
+        exchanges += httpGetExchanges(
+            "h", "/dash/" + name, [httpResponse(ASSETS[name])]
+        )
+    return exchanges
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("assets")
+    return tmp_path / "assets"
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_downloads_missing_then_skips(replay, assets):
+    esp = ESP8266(uart=replay(syncExchanges(manifest(ASSETS), ASSETS)))
+    result = esp.syncAssets("h", "/dash/manifest.json", "assets")
+    assert result["downloaded"] == ["logo.png", "js/app.js"]
+    assert read(assets / "js" / "app.js") == ASSETS["js/app.js"]
+
+    esp = ESP8266(uart=replay(syncExchanges(manifest(ASSETS), [])))
+    result = esp.syncAssets("h", "/dash/manifest.json", "assets")
+    assert result["skipped"] == ["logo.png", "js/app.js"]
+    assert result["downloaded"] == []
+
+
+def test_replaces_changed_file(replay, assets):
+    (assets / "logo.png").write_bytes(b"old logo")
+    files = {"logo.png": ASSETS["logo.png"]}
+    esp = ESP8266(uart=replay(syncExchanges(manifest(files), files)))
+
+    assert esp.syncAssets("h", "/dash/manifest.json", "assets")["downloaded"] == [
+        "logo.png"
+    ]
+    assert read(assets / "logo.png") == ASSETS["logo.png"]
+    assert sorted(os.listdir(assets)) == ["logo.png"]
+
+
+def test_recovers_verified_tmp_without_download(replay, assets):
+    # Power lost between removing the old file and renaming the new one
+    (assets / "logo.png.tmp").write_bytes(ASSETS["logo.png"])
+    files = {"logo.png": ASSETS["logo.png"]}
+    esp = ESP8266(uart=replay(syncExchanges(manifest(files), [])))
+
+    assert esp.syncAssets("h", "/dash/manifest.json", "assets")["downloaded"] == [
+        "logo.png"
+    ]
+    assert sorted(os.listdir(assets)) == ["logo.png"]
+
+
+def test_invalid_manifest(replay, assets):
+    esp = ESP8266(uart=replay(syncExchanges(b'{"files": 5}', [])))
+    assert esp.syncAssets("h", "/dash/manifest.json", "assets") is None
+
+
+def test_invalid_entries_fail(replay, assets):
+    os.mkdir(assets / "js")
+    entries = [
+        {"size": 3},
+        {"path": "../up", "size": 3},
+        {"path": "a", "sha256": 5},
+        {"path": "b", "size": "3"},
+        {"path": "js"},
+        "junk",
+    ]
+    body = json.dumps({"files": entries}).encode()
+    esp = ESP8266(uart=replay(syncExchanges(body, [])))
+
+    result = esp.syncAssets("h", "/dash/manifest.json", "assets")
+    assert len(result["failed"]) == len(entries)
+    assert result["skipped"] == [] and result["downloaded"] == []
+
+
+def test_over_budget_asset_is_too_large(replay, assets):
+    files = {"logo.png": ASSETS["logo.png"]}
+    exchanges = syncExchanges(manifest(files), [])
+    big = b"x" * 2000
+    exchanges += httpGetExchanges("h", "/dash/logo.png", [httpResponse(big)])
+    esp = ESP8266(uart=replay(exchanges), mem_budget=1000)
+
+    result = esp.syncAssets("h", "/dash/manifest.json", "assets")
+    assert result["too_large"] == ["logo.png"]
+    assert os.listdir(assets) == []
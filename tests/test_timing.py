@@ -0,0 +1,132 @@
+from time import monotonic
+
+import pytest
+
+import esp8266
+from conftest import ScriptedUART, httpGetExchanges, httpResponse, ipd
+from esp8266 import ESP8266, _httpComplete, parseHTTP
+
+HEADER = b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n"
+
+
+@pytest.fixture(autouse=True)
+def noBackoff(monkeypatch):
+    monkeypatch.setattr(esp8266, "_backoff", lambda attempt: 0)
+
+
+def test_parse_split_ipd():
+    assert parseHTTP(ipd(HEADER + b"01234") + ipd(b"56789")) == (200, b"0123456789")
+
+
+def test_parse_short_body_is_refused():
+    assert parseHTTP(ipd(HEADER + b"01234")) == (0, None)
+
+
+def test_parse_trims_to_content_length():
+    assert parseHTTP(ipd(HEADER + b"0123456789") + b"\r\nCLOSED\r\n") == (
+        200,
+        b"0123456789",
+    )
+
+
+def test_parse_without_content_length():
+    assert parseHTTP(ipd(b"HTTP/1.1 200 OK\r\n\r\nhello")) == (200, b"hello")
+
+
+def test_http_complete():
+    response = ipd(HEADER + b"01234") + ipd(b"56789")
+    assert _httpComplete(response)
+    assert not _httpComplete(response[:-1])
+    # Status strings inside the payload don't count
+    assert not _httpComplete(ipd(HEADER + b"CLOSED\r\n"))
+    nolength = ipd(b"HTTP/1.1 200 OK\r\n\r\nhello")
+    assert not _httpComplete(nolength)
+    assert _httpComplete(nolength + b"\r\nCLOSED\r\n")
+
+
+def test_update_rtt_converges_to_floor():
+    esp = ESP8266(uart=ScriptedUART())
+    for _ in range(30):
+        esp._updateRTT("AT+CIPSTART", 0.05)
+    srtt, _, timeout, floor, _ = esp._timing("AT+CIPSTART")
+    assert srtt == pytest.approx(0.05, abs=0.01)
+    assert timeout == floor == 1
+
+
+def test_update_rtt_backoff_is_capped():
+    esp = ESP8266(uart=ScriptedUART())
+    for _ in range(5):
+        esp._updateRTT("AT", None)
+    assert esp._timing("AT")[2] == 4
+
+
+def test_complete_reply_returns_without_waiting_for_srtt(replay):
+    esp = ESP8266(uart=replay(httpGetExchanges("h", "/p", [httpResponse(b"ok")])))
+    esp._timing("HTTP GET")[0] = 0.87
+    stamp = monotonic()
+    assert esp.doHttpGet("h", "/p") == (200, b"ok")
+    assert monotonic() - stamp < 0.5
+
+
+def test_split_body_waits_for_content_length(replay):
+    # Status strings in the payload, and an idle gap between the packets
+    response = httpResponse(b"ERROR\r\nbusy p...\r\n")
+    packets = [response[:-11], (0.1, response[-11:])]
+    uart = replay(httpGetExchanges("h", "/p", packets), realtime=True)
+    esp = ESP8266(uart=uart)
+    assert esp.doHttpGet("h", "/p") == (200, b"ERROR\r\nbusy p...\r\n")
+
+
+def test_busy_is_retried_and_not_sampled(replay):
+    busy = [b"busy p...\r\n"]
+    esp = ESP8266(
+        uart=replay(
+            [(b"AT\r\n", busy), (b"AT\r\n", busy), (b"AT\r\n", [b"\r\nOK\r\n"])]
+        )
+    )
+    assert esp.startUP()
+
+    cipstart = b'AT+CIPSTART="TCP","h",80\r\n'
+    exchanges = [(cipstart, busy)] * 3 + [(b"AT+CIPCLOSE\r\n", [b"\r\nOK\r\n"])]
+    esp = ESP8266(uart=replay(exchanges))
+    assert esp.doHttpGet("h", "/p") == (0, None)
+    srtt, rttvar, _, _, _ = esp._timing("AT+CIPSTART")
+    assert (srtt, rttvar) == (0, 1.25)
+
+
+def test_already_connected_on_first_attempt_fails(replay):
+    cipstart = b'AT+CIPSTART="TCP","h",80\r\n'
+    exchanges = [
+        (cipstart, [b"ALREADY CONNECTED\r\n\r\nERROR\r\n"]),
+        (b"AT+CIPCLOSE\r\n", [b"\r\nOK\r\n"]),
+    ]
+    esp = ESP8266(uart=replay(exchanges))
+    assert esp.doHttpGet("h", "/p") == (0, None)
+
+
+def test_already_connected_on_retry_succeeds(replay):
+    cipstart = b'AT+CIPSTART="TCP","h",80\r\n'
+    exchanges = [(cipstart, []), (cipstart, [b"ALREADY CONNECTED\r\n\r\nERROR\r\n"])]
+    esp = ESP8266(uart=replay(exchanges))
+    # The floor, so the unanswered first attempt times out quickly
+    esp._timing("AT+CIPSTART")[2] = 1
+    assert esp._createTCPConnection("h")
+
+
+class SilentAfterReset(ScriptedUART):
+    def write(self, buf):
+        if buf == b"AT+RST\r\n":
+            self.feed(b"\r\nOK\r\n")
+        return len(buf)
+
+
+def test_restart_is_bounded(monkeypatch):
+    monkeypatch.setattr(esp8266, "ESP8266_RESTART_TIMEOUT", 1.5)
+    esp = ESP8266(uart=SilentAfterReset())
+    timeout = esp._timing("AT")[2]
+
+    stamp = monotonic()
+    assert not esp.reStart()
+    assert monotonic() - stamp < 2
+    # Boot time isn't fed into the RTT estimate
+    assert esp._timing("AT")[2] == timeout